@@ -1,3 +1,4 @@
+import os
 from flask import Flask, render_template, request
 from rag_agent import answer_question_with_weather_info
 
@@ -18,4 +19,4 @@ def index():
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8080))
-    app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=port)
\ No newline at end of file
@@ -1,19 +1,29 @@
 import os
+import re
 import logging
+import threading
+from concurrent.futures import Future
 from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from cachetools import TTLCache
 import google.generativeai as genai
 import json
 
-from weather_fetcher import get_city_weather, get_all_cities, fetch_and_prepare_weather_data
+from weather_fetcher import get_city_weather, get_all_cities, get_suitable_cities, get_cached_weather_data, weather_data_cache
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 GEMINI_API_KEY = "GEMINI_API_KEY"
-genai.configure(api_key=GEMINI_API_KEY)
+# REST transport goes through requests, which gevent's monkey-patching makes
+# cooperative; the default gRPC transport would block the worker
+genai.configure(api_key=GEMINI_API_KEY, transport="rest")
 
-# System prompt for the RAG agent
-SYSTEM_PROMPT = """
+# System prompt for the RAG agent.
+# The static rules are sent as the model's system instruction; the volatile
+# dates go in SYSTEM_PROMPT_DATES so the stable prefix never changes.
+SYSTEM_PROMPT_STATIC = """
 你是一個專業的露營顧問機器人，名字叫「露營天氣達人」。你的專長是根據台灣各地的天氣預報，為使用者提供露營建議。
 
 請根據以下天氣資料作答，禁止自行推測、杜撰或添加未提供的資訊。若資料中找不到使用者提問的地區或時間，請直接告知查無資料。
@@ -24,13 +34,84 @@ SYSTEM_PROMPT = """
 3. 禁止冗長開場或結尾，如「很高興為您服務」等。
 4. 若不適合露營，請簡單建議改期或提醒注意安全。
 5. 僅能參考提供的天氣資料，不得自行推測天氣或日期資訊。
-6. 資料來源日：{current_date}；資料最後更新時間：{last_updated}
+6. 資料來源日與資料最後更新時間會在每次提問時提供。
+"""
+
+SYSTEM_PROMPT_DATES = """
+資料來源日：{current_date}；資料最後更新時間：{last_updated}
 
 今天日期是：{current_date}
 
 最後更新的天氣資料時間：{last_updated}
 """
 
+# Keywords that indicate a general weather question, compiled into one pattern
+WEATHER_KEYWORDS = ("天氣", "氣象", "溫度", "下雨", "降雨", "露營", "適合", "哪裡", "何處", "推薦")
+_WEATHER_KW_RE = re.compile("|".join(map(re.escape, WEATHER_KEYWORDS)))
+
+# City-name matcher, rebuilt only when the list of available cities changes
+_city_matcher = {
+    "cities": None,
+    "pattern": None
+}
+
+# Trivial messages answered locally without calling the LLM
+GREETING_REPLIES = {
+    "你好": "你好！我是露營天氣達人，想知道哪個縣市適合露營嗎？",
+    "哈囉": "哈囉！我是露營天氣達人，想知道哪個縣市適合露營嗎？",
+    "hi": "Hi！我是露營天氣達人，想知道哪個縣市適合露營嗎？",
+    "hello": "Hello！我是露營天氣達人，想知道哪個縣市適合露營嗎？",
+    "謝謝": "不客氣！祝你露營愉快 ⛺",
+    "掰掰": "掰掰！出發前記得再確認天氣喔 ⛺",
+}
+_DATE_QUERY_RE = re.compile(r"^(今天|現在).*(幾點|星期|日期)")
+_TRAILING_PUNCTUATION = "!！?？~～。.，, "
+_WEEKDAYS = "一二三四五六日"
+
+# Users are in Taiwan; the container clock is usually UTC
+LOCAL_TZ = ZoneInfo("Asia/Taipei")
+
+# Reply used when the LLM call fails; never cached as an answer
+LLM_ERROR_MESSAGE = "抱歉，我暫時無法處理您的請求。請稍後再試。"
+
+# Identical questions asked at the same time share one LLM call, and recent
+# answers are reused for a few minutes
+_inflight = {}
+_inflight_lock = threading.Lock()
+_answer_cache = TTLCache(maxsize=256, ttl=300)
+
+# Model and generation settings are built once and reused for every query
+_MODEL = genai.GenerativeModel(
+    model_name="gemini-1.5-flash",
+    system_instruction=SYSTEM_PROMPT_STATIC
+)
+_GEN_CFG = genai.types.GenerationConfig(
+    temperature=0.4,
+    max_output_tokens=300,
+)
+
+def get_city_pattern(cities):
+    """
+    Get a compiled pattern matching any of the given city names.
+    
+    pattern.search() returns the leftmost city mentioned in a query, preferring
+    the longest name at that position. re tries each alternative in turn at
+    every position, which is cheap for ~22 short names.
+    
+    Args:
+        cities: Sequence of city/county names
+        
+    Returns:
+        Compiled regex, or None if there are no cities
+    """
+    cities = tuple(cities)
+    if _city_matcher["cities"] != cities:
+        # Longest names first so overlapping names resolve to the most specific one
+        names = sorted(cities, key=len, reverse=True)
+        _city_matcher["pattern"] = re.compile("|".join(map(re.escape, names))) if names else None
+        _city_matcher["cities"] = cities
+    return _city_matcher["pattern"]
+
 def get_weather_context(city_name=None):
     """
     Generate context information about weather based on user query.
@@ -44,27 +125,8 @@ def get_weather_context(city_name=None):
     try:
         # If no specific city, get overview of all cities
         if not city_name:
-            all_data = fetch_and_prepare_weather_data()
-            context = "目前有以下縣市的天氣資料：\n"
-            
-            suitable_cities = []
-            for city, data in all_data.items():
-                # Check if any days in the next 3 days are suitable
-                next_3_days = data['forecasts'][:3] if len(data['forecasts']) >= 3 else data['forecasts']
-                if any(day['is_suitable_for_camping'] for day in next_3_days):
-                    suitable_cities.append(city)
-            
-            if suitable_cities:
-                context += f"\n近三天適合露營的縣市有：{', '.join(suitable_cities)}\n"
-            else:
-                context += "\n近三天所有縣市的天氣狀況都不太適合露營。\n"
-                
-            # Add a sample of detailed data for one city
-            sample_city = "臺北市" if "臺北市" in all_data else list(all_data.keys())[0]
-            context += f"\n以下是{sample_city}的天氣資料範例：\n"
-            context += format_city_weather(all_data[sample_city])
-            
-            return context
+            get_cached_weather_data()
+            return _format_overview(_data_version())
         
         # Get specific city data
         city_data = get_city_weather(city_name)
@@ -80,12 +142,51 @@ def get_weather_context(city_name=None):
         if not city_data:
             return f"找不到 '{city_name}' 的天氣資料。可用的縣市有：{', '.join(get_all_cities())}"
         
-        return format_city_weather(city_data, city_name)
+        return _format_city(city_name, _data_version())
         
     except Exception as e:
         logging.error(f"Error getting weather context: {e}")
         return "抱歉，無法獲取天氣資料。系統可能暫時發生錯誤。"
 
+def _data_version():
+    """Get a version key for the cached weather data, changing on every refresh"""
+    last_updated = weather_data_cache["last_updated"]
+    return last_updated.timestamp() if last_updated else None
+
+@lru_cache(maxsize=64)
+def _format_city(city_name, version):
+    """Format a city's weather once per data version; old versions age out of the cache"""
+    return format_city_weather(get_city_weather(city_name), city_name)
+
+@lru_cache(maxsize=4)
+def _format_overview(version):
+    """
+    Build the overview of all cities once per data version.
+    
+    Args:
+        version: Data version from _data_version, used only as the cache key
+        
+    Returns:
+        String with the overview weather context
+    """
+    all_data = get_cached_weather_data()
+    context = "目前有以下縣市的天氣資料：\n"
+    
+    # Precomputed when the weather data was refreshed
+    suitable_cities = get_suitable_cities()
+    
+    if suitable_cities:
+        context += f"\n近三天適合露營的縣市有：{', '.join(suitable_cities)}\n"
+    else:
+        context += "\n近三天所有縣市的天氣狀況都不太適合露營。\n"
+        
+    # Add a sample of detailed data for one city
+    sample_city = "臺北市" if "臺北市" in all_data else list(all_data.keys())[0]
+    context += f"\n以下是{sample_city}的天氣資料範例：\n"
+    context += _format_city(sample_city, version)
+    
+    return context
+
 def format_city_weather(city_data, city_name=None):
     """
     Format city weather data in a readable format.
@@ -100,15 +201,16 @@ def format_city_weather(city_data, city_name=None):
     if not city_name:
         city_name = city_data.get('name', "該地區")
     
-    result = f"{city_name}未來一週天氣預報：\n\n"
+    # Collect the pieces and join once instead of growing a string with +=
+    parts = [f"{city_name}未來一週天氣預報：\n\n"]
     
     for day in city_data['forecasts']:
         date = day['display_date']
         suitable = "適合" if day['is_suitable_for_camping'] else "不適合"
         reason = day['suitability_reasons']
         
-        result += f"📅 {date}：{suitable}露營\n"
-        result += f"📝 {reason}\n"
+        parts.append(f"📅 {date}：{suitable}露營\n")
+        parts.append(f"📝 {reason}\n")
         
         # Add detailed weather for this day
         for period in day['periods']:
@@ -117,64 +219,143 @@ def format_city_weather(city_data, city_name=None):
             precip = f"{period['precipitation_prob']}%" if period['precipitation_prob'] != '-' else "N/A"
             weather = period['weather']
             
-            result += f"🕒 {time_period}：{weather}，溫度 {temp_range}，降雨機率 {precip}\n"
+            parts.append(f"🕒 {time_period}：{weather}，溫度 {temp_range}，降雨機率 {precip}\n")
         
-        result += "\n"
+        parts.append("\n")
     
-    return result
-
-def query_llm(user_message, city_context=None):
-    try:
-        # Prepare system prompt
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        weather_data = fetch_and_prepare_weather_data()
-        last_updated = "未知" if weather_data.get("last_updated") is None else weather_data.get("last_updated").strftime("%Y-%m-%d %H:%M:%S")
+    return "".join(parts)
 
-        system_prompt = SYSTEM_PROMPT.format(
-            current_date=current_date,
-            last_updated=last_updated
-        )
+@lru_cache(maxsize=4)
+def _format_date_prompt(current_date, last_updated):
+    """
+    Fill in the date part of the system prompt.
+    
+    Cached because the inputs only change once a day or once per data refresh.
+    
+    Args:
+        current_date: Today's date
+        last_updated: Datetime of the last weather data update, or None
+        
+    Returns:
+        String with the formatted date prompt
+    """
+    return SYSTEM_PROMPT_DATES.format(
+        current_date=current_date.strftime("%Y-%m-%d"),
+        last_updated="未知" if last_updated is None else last_updated.strftime("%Y-%m-%d %H:%M:%S")
+    )
 
-        # Create model
-        model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+def query_llm(user_message, city_context=None, last_updated=None):
+    try:
+        # Prepare system prompt; last_updated comes from the caller's cache read
+        date_prompt = _format_date_prompt(datetime.now(LOCAL_TZ).date(), last_updated)
 
         # Build full prompt
-        full_prompt = f"{system_prompt}\n"
+        full_prompt = f"{date_prompt}\n"
         if city_context:
             full_prompt += f"\n以下是相關的天氣資料，請根據這些資料回答使用者：\n\n{city_context}\n"
         full_prompt += f"\n使用者提問：{user_message}\n"
 
-        response = model.generate_content(
-            full_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.4,  
-                max_output_tokens=300,  
-            )
-)
+        response = _MODEL.generate_content(full_prompt, generation_config=_GEN_CFG)
 
         return response.text
 
     except Exception as e:
         logging.error(f"Error querying LLM: {e}")
-        return "抱歉，我暫時無法處理您的請求。請稍後再試。"
+        return LLM_ERROR_MESSAGE
+
+def get_local_reply(user_query):
+    """
+    Answer greetings and date/time questions locally.
+    
+    Args:
+        user_query: User's question
+        
+    Returns:
+        Reply string, or None if the query needs the LLM
+    """
+    text = user_query.strip().rstrip(_TRAILING_PUNCTUATION).lower()
+    
+    reply = GREETING_REPLIES.get(text)
+    if reply:
+        return reply
+    
+    # Leave anything that also asks about weather or camping to the LLM
+    if _DATE_QUERY_RE.search(text) and not _WEATHER_KW_RE.search(text):
+        now = datetime.now(LOCAL_TZ)
+        return f"現在是 {now.strftime('%Y-%m-%d')}（星期{_WEEKDAYS[now.weekday()]}）{now.strftime('%H:%M')}。"
+    
+    return None
+
 def process_query(user_query):
     """
     Process a user query and return a response.
     
+    Concurrent identical queries wait for the first one's answer instead of
+    each calling the LLM, and answers are cached for 5 minutes per weather
+    data version and date.
+    
+    Args:
+        user_query: User's question
+        
+    Returns:
+        Response from the LLM
+    """
+    # Greetings and date questions don't need a round trip to Gemini
+    local_reply = get_local_reply(user_query)
+    if local_reply:
+        return local_reply
+    
+    # Answers depend on the weather data and on today's date in the prompt, so
+    # both are part of the key; a refresh or a new day never reuses old answers
+    version = _data_version()
+    key = (" ".join(user_query.split()), version, datetime.now(LOCAL_TZ).date())
+    
+    with _inflight_lock:
+        cached = _answer_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight[key] = future
+    
+    if not is_owner:
+        return future.result()
+    
+    response = None
+    try:
+        response = _answer_query(user_query)
+        future.set_result(response)
+        return response
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            # Don't keep answers built without weather data (e.g. CWB down on a
+            # cold start); they'd outlive the outage
+            if version is not None and response is not None and response != LLM_ERROR_MESSAGE:
+                _answer_cache[key] = response
+            del _inflight[key]
+
+def _answer_query(user_query):
+    """
+    Find the weather context for a user query and ask the LLM.
+    
     Args:
         user_query: User's question
         
     Returns:
         Response from the LLM
     """
-    # Extract potential location from query
-    cities = get_all_cities()
+    # Extract potential location from query (this also loads the weather data once)
+    city_pattern = get_city_pattern(get_all_cities())
+    last_updated = weather_data_cache["last_updated"]
     
-    mentioned_city = None
-    for city in cities:
-        if city in user_query:
-            mentioned_city = city
-            break
+    match = city_pattern.search(user_query) if city_pattern else None
+    mentioned_city = match.group(0) if match else None
     
     # Get weather context if a city is mentioned
     context = None
@@ -182,12 +363,11 @@ def process_query(user_query):
         context = get_weather_context(mentioned_city)
     else:
         # Check for general weather queries
-        weather_keywords = ["天氣", "氣象", "溫度", "下雨", "降雨", "露營", "適合", "哪裡", "何處", "推薦"]
-        if any(keyword in user_query for keyword in weather_keywords):
+        if _WEATHER_KW_RE.search(user_query):
             context = get_weather_context()
     
     # Get response from LLM
-    response = query_llm(user_query, context)
+    response = query_llm(user_query, context, last_updated)
     
     return response
 
@@ -1,8 +1,22 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import math
+import re
+import threading
+import diskcache
 from datetime import datetime, timedelta
 import logging
 import traceback
+import time
+
+# orjson parses the large CWB payload several times faster than the stdlib;
+# fall back to json so the module still runs where it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,20 +25,143 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 API_KEY = "API_KEY"
 API_URL = "https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-D0047-091"
 
+# Shared HTTP session so refreshes reuse a pooled keep-alive connection
+# instead of paying a fresh TCP + TLS handshake on every fetch
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+))
+
 # Cache to store weather info and camping suitability
 # Will store data with a timestamp to handle refreshes
 weather_data_cache = {
     "last_updated": None,
-    "data": {}
+    "data": {},
+    # Views derived from "data", rebuilt whenever the data is replaced
+    "sorted_cities": None,
+    "suitable_cities": None
+}
+
+# On-disk copy of the processed data, shared across restarts and Gunicorn workers
+CACHE_TTL_SECONDS = 10800
+_DISK_CACHE_KEY = (API_URL, "processed")
+_DC = diskcache.Cache("/tmp/weather_cache")
+
+# Upper bound on the (decompressed) API response we are willing to load
+MAX_RESPONSE_BYTES = 20_000_000
+
+# Background refresh keeps the cache warm so requests never wait on the API
+REFRESH_INTERVAL_SECONDS = 3600
+_refresh_lock = threading.Lock()
+_refresh_thread = None
+_started = False
+
+# After a failed fetch, request-path callers wait this long before trying
+# again instead of each queueing behind another slow, retried API call
+FETCH_FAILURE_COOLDOWN_SECONDS = 60
+_last_failed_fetch = None
+
+# Map element names to standardized names
+_ELEMENT_MAPPING = {
+    # Standard API names
+    "平均溫度": "平均溫度",
+    "最高溫度": "最高溫度",
+    "最低溫度": "最低溫度",
+    "平均相對濕度": "平均相對濕度",
+    "12小時降雨機率": "12小時降雨機率",
+    "天氣現象": "天氣現象",
+    "天氣預報綜合描述": "天氣預報綜合描述",
+    "風向": "風向",
+    "風速": "風速",
+    
+    # Alternative names sometimes used
+    "T": "平均溫度",
+    "Tx": "最高溫度",
+    "Tn": "最低溫度",
+    "RH": "平均相對濕度",
+    "PoP12h": "12小時降雨機率",
+    "Wx": "天氣現象",
+    "WeatherDescription": "天氣預報綜合描述",
+    "WD": "風向",
+    "WS": "風速"
 }
 
-def is_number(value):
-    """Check if a value can be converted to a number"""
+# Camping suitability thresholds, shared by the judgment and its reasons
+MAX_PRECIP_PROB = 40   # %
+MIN_TEMP = 15          # °C
+MAX_TEMP = 32          # °C
+MAX_WIND_SPEED = 8     # m/s
+
+# Extreme weather that makes a day unsuitable for camping
+_BAD_WX = ("雷雨", "豪雨", "大雨", "暴風", "強風")
+_BAD_WX_RE = re.compile("|".join(_BAD_WX))
+
+def _json_loads(raw):
+    """Parse a JSON document from bytes"""
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def _json_preview(obj, limit=100):
+    """Serialize an object to JSON and truncate it for log messages"""
+    if orjson:
+        return orjson.dumps(obj)[:limit].decode("utf-8", errors="ignore")
+    return json.dumps(obj)[:limit]
+
+def _read_limited(response, limit=MAX_RESPONSE_BYTES):
+    """
+    Read a streamed response body, refusing anything larger than limit.
+    
+    Args:
+        response: Response opened with stream=True
+        limit: Maximum number of bytes to read
+        
+    Returns:
+        Response body as bytes
+    """
+    declared = int(response.headers.get("Content-Length") or 0)
+    if declared > limit:
+        raise ValueError(f"API response too large: {declared} bytes")
+    
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=65536):
+        size += len(chunk)
+        if size > limit:
+            raise ValueError(f"API response exceeded {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def _is_iso_date_prefix(value):
+    """Check that a timestamp string starts with a YYYY-MM-DD date"""
+    return (
+        isinstance(value, str) and len(value) >= 10 and
+        value[4] == "-" and value[7] == "-" and
+        value[:4].isdigit() and value[5:7].isdigit() and value[8:10].isdigit()
+    )
+
+def _to_float(value, default=math.nan):
+    """Convert a value to float, returning default (NaN) if it is not a number"""
     try:
-        float(value)
-        return True
+        return float(value)
     except (ValueError, TypeError):
-        return False
+        return default
+
+def update_cache(processed_data, last_updated):
+    """
+    Replace the cached weather data and rebuild the views derived from it.
+    
+    Args:
+        processed_data: Dictionary of processed weather data by location
+        last_updated: Datetime the data was fetched
+    """
+    weather_data_cache["data"] = processed_data
+    weather_data_cache["last_updated"] = last_updated
+    weather_data_cache["sorted_cities"] = tuple(sorted(processed_data.keys()))
+    # Cities with at least one suitable day in the next 3 days
+    weather_data_cache["suitable_cities"] = [
+        city for city, city_data in processed_data.items() if city_data.get("next3_suitable")
+    ]
 
 def fetch_and_prepare_weather_data(force_refresh=False):
     """
@@ -39,17 +176,101 @@ def fetch_and_prepare_weather_data(force_refresh=False):
     global weather_data_cache
     
     # Check if we need to refresh the cache (older than 3 hours or forced)
-    current_time = datetime.now()
-    needs_refresh = (
-        force_refresh or 
-        weather_data_cache["last_updated"] is None or
-        (current_time - weather_data_cache["last_updated"]).total_seconds() > 10800
-    )
-    
-    if not needs_refresh and weather_data_cache["data"]:
+    if not force_refresh and is_cache_fresh():
         logging.info("Using cached weather data")
         return weather_data_cache["data"]
     
+    if not force_refresh and in_failure_cooldown():
+        logging.info("Skipping weather fetch; the last attempt failed recently")
+        return weather_data_cache["data"]
+    
+    # Only one thread fetches at a time; the others wait and reuse its result
+    with _refresh_lock:
+        if not force_refresh and (is_cache_fresh() or in_failure_cooldown()):
+            return weather_data_cache["data"]
+        return _refresh_weather_data(None if force_refresh else CACHE_TTL_SECONDS)
+
+def _read_disk_cache(current_time, max_age):
+    """
+    Read the processed data from the disk cache if it is recent enough.
+    
+    Disk cache errors (lock timeouts between workers, unreadable entries) are
+    logged and treated as a miss, so the caller falls through to the API.
+    
+    Args:
+        current_time: Datetime to measure the entry's age against
+        max_age: Maximum age in seconds
+        
+    Returns:
+        Dictionary with "data" and "last_updated", or None
+    """
+    try:
+        cached = _DC.get(_DISK_CACHE_KEY)
+        if cached and cached["data"] and (current_time - cached["last_updated"]).total_seconds() <= max_age:
+            return cached
+    except Exception as e:
+        logging.warning(f"Could not read weather data from disk cache: {e}")
+    return None
+
+def _write_disk_cache(processed_data, last_updated):
+    """
+    Store the processed data in the disk cache for other workers.
+    
+    The fetch has already succeeded and the in-memory cache is updated, so
+    disk cache errors (e.g. lock timeouts between workers) are only logged.
+    
+    Args:
+        processed_data: Dictionary of processed weather data by location
+        last_updated: Datetime the data was fetched
+    """
+    try:
+        # transact() keeps the write atomic across workers
+        with _DC.transact():
+            _DC.set(_DISK_CACHE_KEY, {"data": processed_data, "last_updated": last_updated}, expire=CACHE_TTL_SECONDS)
+    except Exception as e:
+        logging.warning(f"Could not write weather data to disk cache: {e}")
+
+def is_cache_fresh():
+    """Check whether the in-memory cache holds data younger than the cache TTL"""
+    last_updated = weather_data_cache["last_updated"]
+    return (
+        bool(weather_data_cache["data"]) and
+        last_updated is not None and
+        (datetime.now() - last_updated).total_seconds() <= CACHE_TTL_SECONDS
+    )
+
+def in_failure_cooldown():
+    """Check whether the last fetch failed less than FETCH_FAILURE_COOLDOWN_SECONDS ago"""
+    return (
+        _last_failed_fetch is not None and
+        time.monotonic() - _last_failed_fetch < FETCH_FAILURE_COOLDOWN_SECONDS
+    )
+
+def _refresh_weather_data(disk_max_age):
+    """
+    Load weather data from the disk cache or the CWB API into the in-memory cache.
+    
+    Must be called with _refresh_lock held.
+    
+    Args:
+        disk_max_age: Accept a disk cache entry up to this many seconds old
+            instead of calling the API; None always calls the API
+        
+    Returns:
+        Dictionary of processed weather data by location
+    """
+    global _last_failed_fetch
+    
+    current_time = datetime.now()
+    
+    # Another worker (or a previous process) may already have fetched fresh data
+    if disk_max_age is not None:
+        cached = _read_disk_cache(current_time, disk_max_age)
+        if cached:
+            logging.info("Using weather data from disk cache")
+            update_cache(cached["data"], cached["last_updated"])
+            return cached["data"]
+    
     logging.info("Fetching fresh weather data from CWB API")
     
     params = {
@@ -58,35 +279,85 @@ def fetch_and_prepare_weather_data(force_refresh=False):
     }
     
     try:
-        response = requests.get(API_URL, params=params)
-        response.raise_for_status()  # Raise an exception for 4XX/5XX responses
-        data = response.json()
+        with _SESSION.get(API_URL, params=params, timeout=(3.05, 10), stream=True) as response:
+            response.raise_for_status()  # Raise an exception for 4XX/5XX responses
+            data = _json_loads(_read_limited(response))
         
         if data.get("success") != "true":
             raise Exception(f"API returned unsuccessful response: {data}")
             
-        # Process the received data
+        # Process the received data into a new dict, then swap it in whole
         processed_data = process_weather_data(data)
         
         # Add location name to each entry
         for location_name, location_data in processed_data.items():
             location_data['name'] = location_name
         
+        # A response we couldn't read must not wipe out the data we already have
+        if not processed_data:
+            logging.error("Weather API response contained no usable locations; keeping cached data")
+            _last_failed_fetch = time.monotonic()
+            return weather_data_cache["data"]
+        
         # Update cache with new data and timestamp
-        weather_data_cache["data"] = processed_data
-        weather_data_cache["last_updated"] = current_time
+        update_cache(processed_data, current_time)
+        _last_failed_fetch = None
+        
+        # Persist for other workers
+        _write_disk_cache(processed_data, current_time)
         
         return processed_data
         
     except requests.exceptions.RequestException as e:
         logging.error(f"Error fetching weather data: {e}")
+        _last_failed_fetch = time.monotonic()
         # Return cached data if available, otherwise empty dict
         return weather_data_cache["data"] if weather_data_cache["data"] else {}
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
         logging.error(traceback.format_exc())
+        _last_failed_fetch = time.monotonic()
         return weather_data_cache["data"] if weather_data_cache["data"] else {}
 
+def get_cached_weather_data():
+    """
+    Get the current weather data without waiting on a refresh.
+    
+    The background thread keeps the cache up to date; only a cold start with
+    an empty cache fetches synchronously, and not again within
+    FETCH_FAILURE_COOLDOWN_SECONDS of a failed attempt.
+    
+    Returns:
+        Dictionary of processed weather data by location
+    """
+    data = weather_data_cache["data"]
+    if not data:
+        data = fetch_and_prepare_weather_data()
+    return data
+
+def _refresh_loop():
+    """
+    Refresh the weather cache every REFRESH_INTERVAL_SECONDS.
+    
+    A disk cache entry written by another worker within the last interval is
+    reused, so N workers share one API call per interval.
+    """
+    while True:
+        time.sleep(REFRESH_INTERVAL_SECONDS)
+        logging.info("Background refresh of weather data")
+        with _refresh_lock:
+            _refresh_weather_data(REFRESH_INTERVAL_SECONDS)
+
+def start_background_refresh():
+    """Start the background refresh thread once per process"""
+    global _started, _refresh_thread
+    
+    if _started:
+        return
+    _started = True
+    _refresh_thread = threading.Thread(target=_refresh_loop, name="weather-refresh", daemon=True)
+    _refresh_thread.start()
+
 def process_weather_data(data):
     """
     Process raw weather API data into a more useful format and calculate camping suitability.
@@ -128,209 +399,200 @@ def process_weather_data(data):
             return {}
         
         for location in locations:
-            # Extract location name, with fallbacks
-            city_name = None
-            if "LocationName" in location:
-                city_name = location["LocationName"]
-            elif "locationName" in location:
-                city_name = location["locationName"]
-            elif "name" in location:
-                city_name = location["name"]
-            
-            if not city_name:
-                logging.warning(f"Could not find location name in {json.dumps(location)[:100]}...")
-                continue
+            result = _process_one_location(location)
+            if result:
+                city_name, city_data = result
+                processed_data[city_name] = city_data
+    
+    except KeyError as e:
+        logging.error(f"Error processing weather data (missing key): {e}")
+        logging.error(traceback.format_exc())
+    except Exception as e:
+        logging.error(f"Unexpected error processing weather data: {e}")
+        logging.error(traceback.format_exc())
+    
+    return processed_data
+
+def _process_one_location(location):
+    """
+    Process one location from the API response into forecasts by day.
+    
+    Args:
+        location: Raw location entry from the weather API
+        
+    Returns:
+        Tuple of (city name, processed city data), or None if the entry is unusable
+    """
+    # Extract location name, with fallbacks
+    city_name = None
+    if "LocationName" in location:
+        city_name = location["LocationName"]
+    elif "locationName" in location:
+        city_name = location["locationName"]
+    elif "name" in location:
+        city_name = location["name"]
+    
+    if not city_name:
+        logging.warning(f"Could not find location name in {_json_preview(location)}...")
+        return None
+    
+    # Extract weather elements
+    weather_elements = {}
+    
+    # Try to find weather elements array with different possible names
+    elements_array = None
+    if "WeatherElement" in location:
+        elements_array = location["WeatherElement"]
+    elif "weatherElement" in location:
+        elements_array = location["weatherElement"]
+    
+    if not elements_array or not isinstance(elements_array, list):
+        logging.warning(f"Could not find weather elements for {city_name}")
+        return None
+    
+    # Process elements
+    for element in elements_array:
+        element_name = None
+        if "ElementName" in element:
+            element_name = element["ElementName"]
+        elif "elementName" in element:
+            element_name = element["elementName"]
+        
+        if not element_name:
+            continue
+        
+        # Get standardized name
+        std_name = _ELEMENT_MAPPING.get(element_name, element_name)
+        
+        # Get time data with different possible field names
+        time_data = None
+        if "Time" in element:
+            time_data = element["Time"]
+        elif "time" in element:
+            time_data = element["time"]
+        
+        if not time_data or not isinstance(time_data, list):
+            continue
+        
+        weather_elements[std_name] = time_data
+    
+    # Get forecast data for next few days
+    forecasts = []
+    
+    # Try to find start times in either 平均溫度 or T element
+    temp_element = weather_elements.get("平均溫度", [])
+    if not temp_element:
+        # Try alternative name
+        temp_element = weather_elements.get("T", [])
+    
+    if not temp_element:
+        logging.warning(f"Could not find temperature data for {city_name}")
+        return None
+    
+    # Group time slot indices by day in a single pass (up to 7 days)
+    day_to_slots = {}
+    for i, time_slot in enumerate(temp_element):
+        # Extract start time with different possible field names
+        start_time_str = time_slot.get("StartTime", time_slot.get("startTime"))
+        if not start_time_str:
+            continue
+        
+        # Drop malformed timestamps before they take up one of the 7 day slots
+        if not _is_iso_date_prefix(start_time_str):
+            logging.warning(f"Invalid datetime format: {start_time_str}")
+            continue
+        
+        day_key = start_time_str[:10]  # YYYY-MM-DD prefix of the ISO timestamp
+        if day_key not in day_to_slots:
+            if len(day_to_slots) >= 7:  # Limit to 7 days
+                break
+            day_to_slots[day_key] = []
+        day_to_slots[day_key].append(i)
             
-            # Extract weather elements
-            weather_elements = {}
+    # Process each day
+    for day_key, slot_indices in sorted(day_to_slots.items()):
+        day_forecasts = []
+        
+        # Process each 12-hour period
+        for i in slot_indices:
+            time_slot = temp_element[i]
             
-            # Try to find weather elements array with different possible names
-            elements_array = None
-            if "WeatherElement" in location:
-                elements_array = location["WeatherElement"]
-            elif "weatherElement" in location:
-                elements_array = location["weatherElement"]
+            # Extract start and end times
+            start_time_str = time_slot.get("StartTime", time_slot.get("startTime"))
+            end_time_str = time_slot.get("EndTime", time_slot.get("endTime"))
             
-            if not elements_array or not isinstance(elements_array, list):
-                logging.warning(f"Could not find weather elements for {city_name}")
+            if not start_time_str or not end_time_str:
                 continue
             
-            # Map element names to standardized names
-            element_mapping = {
-                # Standard API names
-                "平均溫度": "平均溫度",
-                "最高溫度": "最高溫度",
-                "最低溫度": "最低溫度",
-                "平均相對濕度": "平均相對濕度",
-                "12小時降雨機率": "12小時降雨機率",
-                "天氣現象": "天氣現象",
-                "天氣預報綜合描述": "天氣預報綜合描述",
-                "風向": "風向",
-                "風速": "風速",
-                
-                # Alternative names sometimes used
-                "T": "平均溫度",
-                "Tx": "最高溫度",
-                "Tn": "最低溫度",
-                "RH": "平均相對濕度",
-                "PoP12h": "12小時降雨機率",
-                "Wx": "天氣現象",
-                "WeatherDescription": "天氣預報綜合描述",
-                "WD": "風向",
-                "WS": "風速"
-            }
+            # Clean up timezone info
+            start_time_str = start_time_str.replace("+08:00", "")
+            end_time_str = end_time_str.replace("+08:00", "")
             
-            # Process elements
-            for element in elements_array:
-                element_name = None
-                if "ElementName" in element:
-                    element_name = element["ElementName"]
-                elif "elementName" in element:
-                    element_name = element["elementName"]
-                
-                if not element_name:
-                    continue
-                
-                # Get standardized name
-                std_name = element_mapping.get(element_name, element_name)
-                
-                # Get time data with different possible field names
-                time_data = None
-                if "Time" in element:
-                    time_data = element["Time"]
-                elif "time" in element:
-                    time_data = element["time"]
-                
-                if not time_data or not isinstance(time_data, list):
-                    continue
-                
-                weather_elements[std_name] = time_data
+            try:
+                start_time = datetime.fromisoformat(start_time_str)
+                end_time = datetime.fromisoformat(end_time_str)
+            except ValueError:
+                logging.warning(f"Invalid datetime format: {start_time_str}")
+                continue
             
-            # Get forecast data for next few days
-            forecasts = []
+            # Format times for display
+            time_period = f"{start_time.strftime('%m/%d %H:%M')} - {end_time.strftime('%H:%M')}"
             
-            # Use startTime to group data by day (up to 7 days)
-            forecast_days = set()
+            # Create forecast object with safe extraction
+            forecast = {
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "time_period": time_period,
+                "avg_temp": extract_value(weather_elements, "平均溫度", i, ["Temperature", "value"], "N/A"),
+                "max_temp": extract_value(weather_elements, "最高溫度", i, ["MaxTemperature", "value"], "N/A"),
+                "min_temp": extract_value(weather_elements, "最低溫度", i, ["MinTemperature", "value"], "N/A"),
+                "relative_humidity": extract_value(weather_elements, "平均相對濕度", i, ["RelativeHumidity", "value"], "N/A"),
+                "weather": extract_value(weather_elements, "天氣現象", i, ["Weather", "value"], "N/A"),
+                "weather_code": extract_value(weather_elements, "天氣現象", i, ["WeatherCode", "measures"], "N/A"),
+                "description": extract_value(weather_elements, "天氣預報綜合描述", i, ["WeatherDescription", "value"], "N/A"),
+            }
             
-            # Try to find start times in either 平均溫度 or T element
-            temp_element = weather_elements.get("平均溫度", [])
-            if not temp_element:
-                # Try alternative name
-                temp_element = weather_elements.get("T", [])
+            # Handle precipitation probability
+            precip = extract_value(weather_elements, "12小時降雨機率", i, ["ProbabilityOfPrecipitation", "value"], "0")
+            forecast["precipitation_prob"] = 0 if precip == "-" else int(precip)
             
-            if not temp_element:
-                logging.warning(f"Could not find temperature data for {city_name}")
-                continue
+            # Extract wind data
+            forecast["wind_direction"] = extract_value(weather_elements, "風向", i, ["WindDirection", "value"], "N/A")
+            forecast["wind_speed"] = extract_value(weather_elements, "風速", i, ["WindSpeed", "value"], "0")
             
-            for time_slot in temp_element:
-                # Extract start time with different possible field names
-                start_time_str = None
-                if "StartTime" in time_slot:
-                    start_time_str = time_slot["StartTime"]
-                elif "startTime" in time_slot:
-                    start_time_str = time_slot["startTime"]
-                
-                if not start_time_str:
-                    continue
-                
-                # Handle timezone in the timestamp
-                start_time_str = start_time_str.replace("+08:00", "")
-                try:
-                    start_time = datetime.fromisoformat(start_time_str)
-                    day_key = start_time.strftime("%Y-%m-%d")
-                    forecast_days.add(day_key)
-                except ValueError:
-                    logging.warning(f"Invalid datetime format: {start_time_str}")
-                    continue
-                
-                if len(forecast_days) > 7:  # Limit to 7 days
-                    break
-                    
-            # Process each day
-            for day_key in sorted(forecast_days):
-                day_forecasts = []
-                
-                # Process each 12-hour period
-                for i, time_slot in enumerate(temp_element):
-                    # Extract start and end times
-                    start_time_str = time_slot.get("StartTime", time_slot.get("startTime"))
-                    end_time_str = time_slot.get("EndTime", time_slot.get("endTime"))
-                    
-                    if not start_time_str or not end_time_str:
-                        continue
-                    
-                    # Clean up timezone info
-                    start_time_str = start_time_str.replace("+08:00", "")
-                    end_time_str = end_time_str.replace("+08:00", "")
-                    
-                    try:
-                        start_time = datetime.fromisoformat(start_time_str)
-                        end_time = datetime.fromisoformat(end_time_str)
-                    except ValueError:
-                        continue
-                    
-                    if start_time.strftime("%Y-%m-%d") != day_key:
-                        continue
-                    
-                    # Format times for display
-                    time_period = f"{start_time.strftime('%m/%d %H:%M')} - {end_time.strftime('%H:%M')}"
-                    
-                    # Create forecast object with safe extraction
-                    forecast = {
-                        "start_time": start_time.isoformat(),
-                        "end_time": end_time.isoformat(),
-                        "time_period": time_period,
-                        "avg_temp": extract_value(weather_elements, "平均溫度", i, ["Temperature", "value"], "N/A"),
-                        "max_temp": extract_value(weather_elements, "最高溫度", i, ["MaxTemperature", "value"], "N/A"),
-                        "min_temp": extract_value(weather_elements, "最低溫度", i, ["MinTemperature", "value"], "N/A"),
-                        "relative_humidity": extract_value(weather_elements, "平均相對濕度", i, ["RelativeHumidity", "value"], "N/A"),
-                        "weather": extract_value(weather_elements, "天氣現象", i, ["Weather", "value"], "N/A"),
-                        "weather_code": extract_value(weather_elements, "天氣現象", i, ["WeatherCode", "measures"], "N/A"),
-                        "description": extract_value(weather_elements, "天氣預報綜合描述", i, ["WeatherDescription", "value"], "N/A"),
-                    }
-                    
-                    # Handle precipitation probability
-                    precip = extract_value(weather_elements, "12小時降雨機率", i, ["ProbabilityOfPrecipitation", "value"], "0")
-                    forecast["precipitation_prob"] = 0 if precip == "-" else int(precip)
-                    
-                    # Extract wind data
-                    forecast["wind_direction"] = extract_value(weather_elements, "風向", i, ["WindDirection", "value"], "N/A")
-                    forecast["wind_speed"] = extract_value(weather_elements, "風速", i, ["WindSpeed", "value"], "0")
-                    
-                    day_forecasts.append(forecast)
-                
-                # Calculate camping suitability for this day
-                if day_forecasts:
-                    is_suitable = judge_camping_suitability(day_forecasts)
-                    
-                    forecasts.append({
-                        "date": day_key,
-                        "display_date": datetime.fromisoformat(day_key).strftime("%m/%d (%a)"),
-                        "periods": day_forecasts,
-                        "is_suitable_for_camping": is_suitable,
-                        "suitability_reasons": get_suitability_reasons(day_forecasts, is_suitable)
-                    })
+            # Numeric copies for the suitability checks (NaN when not a number)
+            forecast["min_temp_f"] = _to_float(forecast["min_temp"])
+            forecast["max_temp_f"] = _to_float(forecast["max_temp"])
+            forecast["wind_speed_f"] = _to_float(forecast["wind_speed"])
             
-            # Get location metadata
-            geocode = location.get("Geocode", location.get("geocode", "N/A"))
-            latitude = location.get("Latitude", location.get("lat", "N/A"))
-            longitude = location.get("Longitude", location.get("lon", "N/A"))
+            day_forecasts.append(forecast)
+        
+        # Calculate camping suitability for this day
+        if day_forecasts:
+            summary = summarize_day(day_forecasts)
+            is_suitable = judge_camping_suitability(summary)
             
-            processed_data[city_name] = {
-                "geocode": geocode,
-                "latitude": latitude,
-                "longitude": longitude,
-                "forecasts": forecasts
-            }
-    
-    except KeyError as e:
-        logging.error(f"Error processing weather data (missing key): {e}")
-        logging.error(traceback.format_exc())
-    except Exception as e:
-        logging.error(f"Unexpected error processing weather data: {e}")
-        logging.error(traceback.format_exc())
-    
-    return processed_data
+            forecasts.append({
+                "date": day_key,
+                "display_date": datetime.fromisoformat(day_key).strftime("%m/%d (%a)"),
+                "periods": day_forecasts,
+                "is_suitable_for_camping": is_suitable,
+                "suitability_reasons": get_suitability_reasons(summary, is_suitable)
+            })
+    
+    # Get location metadata
+    geocode = location.get("Geocode", location.get("geocode", "N/A"))
+    latitude = location.get("Latitude", location.get("lat", "N/A"))
+    longitude = location.get("Longitude", location.get("lon", "N/A"))
+    
+    return city_name, {
+        "geocode": geocode,
+        "latitude": latitude,
+        "longitude": longitude,
+        "forecasts": forecasts,
+        # Whether any of the next 3 days is suitable for camping
+        "next3_suitable": any(day['is_suitable_for_camping'] for day in forecasts[:3])
+    }
 
 def extract_value(weather_elements, element_name, index, possible_keys, default):
     """
@@ -371,45 +633,87 @@ def extract_value(weather_elements, element_name, index, possible_keys, default)
     
     return default
 
-def judge_camping_suitability(forecasts):
+def summarize_day(forecasts):
     """
-    Determine if weather conditions are suitable for camping.
+    Reduce a day's forecast periods to the extremes used by the camping checks.
+    
+    All periods are scanned once here, so judging suitability and building
+    the reasons no longer walk the forecasts separately for each criterion.
     
     Args:
         forecasts: List of forecast periods for a day
         
+    Returns:
+        Dictionary with the highest precipitation probability, lowest and highest
+        temperature, highest wind speed (NaN when no period has a number) and
+        the extreme weather keyword found in each period
+    """
+    max_precip = 0
+    min_temp = max_temp = max_wind = math.nan
+    bad_weather = []
+    
+    for forecast in forecasts:
+        max_precip = max(max_precip, forecast["precipitation_prob"])
+        
+        # NaN-aware running extremes: skip missing values, replace a NaN accumulator
+        value = forecast["min_temp_f"]
+        if not math.isnan(value) and not value >= min_temp:
+            min_temp = value
+        value = forecast["max_temp_f"]
+        if not math.isnan(value) and not value <= max_temp:
+            max_temp = value
+        value = forecast["wind_speed_f"]
+        if not math.isnan(value) and not value <= max_wind:
+            max_wind = value
+        
+        match = _BAD_WX_RE.search(str(forecast["weather"]))
+        if match:
+            bad_weather.append(match.group(0))
+    
+    return {
+        "max_precip": max_precip,
+        "min_temp": min_temp,
+        "max_temp": max_temp,
+        "max_wind": max_wind,
+        "bad_weather": bad_weather
+    }
+
+def judge_camping_suitability(summary):
+    """
+    Determine if weather conditions are suitable for camping.
+    
+    Args:
+        summary: Day summary from summarize_day
+        
     Returns:
         Boolean indicating suitability for camping
     """
     # Check precipitation probability
-    if any(forecast["precipitation_prob"] > 40 for forecast in forecasts):
+    if summary["max_precip"] > MAX_PRECIP_PROB:
         return False
     
     # Check temperature range (too cold or too hot is bad for camping)
-    if any(is_number(forecast["min_temp"]) and float(forecast["min_temp"]) < 15 for forecast in forecasts):
-        return False
-    
-    if any(is_number(forecast["max_temp"]) and float(forecast["max_temp"]) > 32 for forecast in forecasts):
+    # NaN compares False, so missing values never reject a day
+    if summary["min_temp"] < MIN_TEMP or summary["max_temp"] > MAX_TEMP:
         return False
     
     # Check for extreme weather conditions
-    bad_weather_keywords = ["雷雨", "豪雨", "大雨", "暴風", "強風"]
-    if any(any(keyword in str(forecast["weather"]) for keyword in bad_weather_keywords) for forecast in forecasts):
+    if summary["bad_weather"]:
         return False
     
     # Check wind conditions
-    if any(is_number(forecast["wind_speed"]) and float(forecast["wind_speed"]) > 8 for forecast in forecasts):
+    if summary["max_wind"] > MAX_WIND_SPEED:
         return False
     
     # If no rejection criteria are met, it's suitable
     return True
 
-def get_suitability_reasons(forecasts, is_suitable):
+def get_suitability_reasons(summary, is_suitable):
     """
     Generate human-readable reasons for the camping suitability judgment.
     
     Args:
-        forecasts: List of forecast periods for a day
+        summary: Day summary from summarize_day
         is_suitable: Boolean indicating if the day is suitable for camping
         
     Returns:
@@ -421,32 +725,23 @@ def get_suitability_reasons(forecasts, is_suitable):
     reasons = []
     
     # Check precipitation probability
-    max_precip = max((forecast["precipitation_prob"] for forecast in forecasts), default=0)
-    if max_precip > 40:
-        reasons.append(f"降雨機率高 ({max_precip}%)")
+    if summary["max_precip"] > MAX_PRECIP_PROB:
+        reasons.append(f"降雨機率高 ({summary['max_precip']}%)")
     
     # Check temperature range
-    min_temps = [float(forecast["min_temp"]) for forecast in forecasts if is_number(forecast["min_temp"])]
-    max_temps = [float(forecast["max_temp"]) for forecast in forecasts if is_number(forecast["max_temp"])]
+    if summary["min_temp"] < MIN_TEMP:
+        reasons.append(f"溫度過低 (最低 {summary['min_temp']}°C)")
     
-    if min_temps and min(min_temps) < 15:
-        reasons.append(f"溫度過低 (最低 {min(min_temps)}°C)")
-    
-    if max_temps and max(max_temps) > 32:
-        reasons.append(f"溫度過高 (最高 {max(max_temps)}°C)")
+    if summary["max_temp"] > MAX_TEMP:
+        reasons.append(f"溫度過高 (最高 {summary['max_temp']}°C)")
     
     # Check for extreme weather conditions
-    bad_weather_keywords = ["雷雨", "豪雨", "大雨", "暴風", "強風"]
-    for forecast in forecasts:
-        for keyword in bad_weather_keywords:
-            if keyword in str(forecast["weather"]):
-                reasons.append(f"有{keyword}天氣")
-                break
+    for keyword in summary["bad_weather"]:
+        reasons.append(f"有{keyword}天氣")
     
     # Check wind conditions
-    wind_speeds = [float(forecast["wind_speed"]) for forecast in forecasts if is_number(forecast["wind_speed"])]
-    if wind_speeds and max(wind_speeds) > 8:
-        reasons.append(f"風速過大 ({max(wind_speeds)} m/s)")
+    if summary["max_wind"] > MAX_WIND_SPEED:
+        reasons.append(f"風速過大 ({summary['max_wind']} m/s)")
     
     return "不適合露營：" + "，".join(reasons) if reasons else "不適合露營：綜合天氣條件不佳"
 
@@ -460,18 +755,30 @@ def get_city_weather(city_name):
     Returns:
         Dictionary with weather data for the city, or None if not found
     """
-    data = fetch_and_prepare_weather_data()
+    data = get_cached_weather_data()
     return data.get(city_name)
 
 def get_all_cities():
     """
     Get a list of all available cities/counties.
     
+    Returns:
+        Sorted tuple of city/county names
+    """
+    get_cached_weather_data()
+    return weather_data_cache["sorted_cities"] or ()
+
+def get_suitable_cities():
+    """
+    Get the cities with at least one day suitable for camping in the next 3 days.
+    
     Returns:
         List of city/county names
     """
-    data = fetch_and_prepare_weather_data()
-    return sorted(list(data.keys()))
+    get_cached_weather_data()
+    return weather_data_cache["suitable_cities"] or []
+
+start_background_refresh()
 
 if __name__ == "__main__":
     # Test the module
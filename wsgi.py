@@ -0,0 +1,6 @@
+# Patch the standard library before anything else imports sockets or threads,
+# so requests/urllib3 calls to CWB and Gemini yield to other greenlets
+from gevent import monkey
+monkey.patch_all()
+
+from app import app